@@ -1,14 +1,15 @@
 """
 MongoDB Database Initialization Module
 
-This module is responsible for initializing the MongoDB database connection,
-creating necessary indexes, and setting up the database for the Vehicle Allocation System.
+This module is responsible for building the MongoDB client, creating necessary
+indexes, and setting up the database for the Vehicle Allocation System.
 """
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, IndexModel
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 import os
-import asyncio
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,30 +23,85 @@ cluster = os.getenv("MONGO_CLUSTER_URL")
 uri = f"mongodb+srv://{username}:{password}@{
     cluster}/?retryWrites=true&w=majority&appName=Cluster0"
 
-# Initialize MongoDB client and access the database
-client = AsyncIOMotorClient(uri)
-db = client.vallocation_db
-collection = db.vallocation_collection
+# Function to create the MongoDB client
+def create_client() -> AsyncMongoClient:
+    """
+    Create the MongoDB client.
+
+    Called from the application lifespan handler so the client is bound to
+    the event loop that is actually running, rather than whichever loop is
+    current at import time.
+
+    The pool is tuned for many short, concurrent requests: minPoolSize
+    keeps warm sockets so bursts skip the TLS + auth handshake,
+    maxIdleTimeMS reaps sockets left over after a burst, and the wait
+    and server-selection timeouts fail fast instead of hanging when the
+    pool or cluster is saturated.
+
+    Returns:
+        AsyncMongoClient: The MongoDB client.
+    """
+    return AsyncMongoClient(
+        uri,
+        maxPoolSize=200,
+        minPoolSize=10,
+        maxIdleTimeMS=300_000,
+        waitQueueTimeoutMS=10_000,
+        serverSelectionTimeoutMS=5000,
+        compressors="zstd",
+    )
 
 # Function to create indexes
-async def create_indexes():
+async def create_indexes(collection: AsyncCollection):
     """
     Create necessary indexes in the MongoDB collection.
 
     Indexes:
     - Unique index on 'vehicle_id' and 'allocation_date' to prevent double booking
-    - Index on 'employee_id' for efficient querying
+    - Index on 'employee_id' and 'allocation_date' for the history filters
+    - Index on 'driver_id' and 'allocation_date' for the history filters
+    - Index on 'allocation_date' for date-only filters and the
+      newest-first history sort when no other filter applies
+
+    The prefix rule makes each compound index usable for queries on its
+    leading field alone, so no separate single-field indexes are needed
+    for the id fields.
+
+    Skips the build command entirely when the indexes already exist, so
+    frequent restarts (reload, rolling deploys) pay one list_indexes
+    round-trip instead of re-issuing the builds on every boot.
+
+    Args:
+        collection (AsyncCollection): The MongoDB collection.
     """
-    await collection.create_index([("vehicle_id", 1), ("allocation_date", 1)], unique=True)
-    await collection.create_index([("employee_id", 1)])
+    wanted = [
+        IndexModel([("vehicle_id", 1), ("allocation_date", 1)], unique=True),
+        IndexModel([("employee_id", 1), ("allocation_date", 1)]),
+        IndexModel([("driver_id", 1), ("allocation_date", 1)]),
+        IndexModel([("allocation_date", 1)]),
+    ]
+
+    existing = await collection.index_information()
+    missing = [
+        index for index in wanted if index.document["name"] not in existing]
+    if not missing:
+        return
+
+    try:
+        # One batched createIndexes command for everything still missing
+        await collection.create_indexes(missing)
+    except OperationFailure:
+        # An equivalent index already exists (e.g. built manually with
+        # different options); the collection is still queryable, so
+        # don't block startup over it
+        pass
 
 # Function to initialize the database at startup
-async def initialize_db():
+async def initialize_db(collection: AsyncCollection):
     """
     Initialize the MongoDB database by creating necessary indexes.
-    """
-    await create_indexes()
 
-# For running it directly (testing purposes)
-# if __name__ == "__main__":
-#     asyncio.run(initialize_db())
+    Args:
+        collection (AsyncCollection): The MongoDB collection.
+    """
+    await create_indexes(collection)
@@ -5,16 +5,43 @@ This API is designed to manage vehicle allocations for employees.
 It includes CRUD operations and history reporting.
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from routers import route
 from fastapi.middleware.cors import CORSMiddleware
+from config.database import create_client, initialize_db
+import os
 import uvicorn
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Manage the MongoDB client over the application's lifetime.
+
+    The client is built here, inside the running event loop, stashed on
+    app.state for the routes, and closed again on shutdown.
+    """
+    client = create_client()
+    app.state.client = client
+    app.state.db = client.vallocation_db
+    # Non-blocking connectivity check on the async client; fails startup
+    # early if the cluster is unreachable
+    await client.admin.command("ping")
+    await initialize_db(app.state.db.vallocation_collection)
+    yield
+    await client.close()
+
+
 app = FastAPI(
     title="Vehicle Allocation System",
     description="API for managing vehicle allocations for employees. "
                 "Includes CRUD operations and history reporting.",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Include the router from route.py
@@ -58,6 +85,20 @@ if __name__ == "__main__":
 
     Host: Binds the server to all available network interfaces.
     Port: Runs the server on port 8000.
-    Reload: Automatically reloads the server when code changes are detected.
+
+    Set APP_ENV=development for single-process auto-reload; otherwise the
+    server runs one worker per CPU on uvloop + httptools. Each worker
+    builds its own MongoDB client via the lifespan handler, so the
+    per-loop client pattern holds across workers.
     """
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if os.getenv("APP_ENV") == "development":
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=os.cpu_count(),
+            loop="uvloop",
+            http="httptools",
+        )
@@ -5,58 +5,49 @@ This router provides APIs for creating, updating, deleting, and retrieving vehic
 It also includes helper functions for data validation and querying the MongoDB database.
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional, Dict, Any
-from motor.motor_asyncio import AsyncIOMotorCollection
-from datetime import date, datetime
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
+from typing import List, Optional
+from datetime import date, datetime, time
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import DuplicateKeyError
 from models.vallocation_model import Vallocation
 from schemas.schemas import VallocationCreate, VallocationUpdate, VallocationResponse
-from config.database import collection
 
 router = APIRouter()
 
-# Helper function to check if a vehicle is already allocated for a specific day
-async def is_vehicle_allocated(vehicle_id: int, allocation_date: date, collection: AsyncIOMotorCollection) -> bool:
-    """
-    Check if a vehicle is already allocated for a specific date.
-
-    Args:
-        vehicle_id (int): The ID of the vehicle.
-        allocation_date (date): The allocation date to check.
-        collection (AsyncIOMotorCollection): The MongoDB collection.
+# Projection shared by the existence checks: fetch only the _id instead of
+# allocating a fresh projection dict on every request
+_EXIST_PROJ = {"_id": 1}
 
-    Returns:
-        bool: True if the vehicle is already allocated for the given date, False otherwise.
+# Dependency providing the MongoDB collection to the routes
+async def get_collection(request: Request) -> AsyncCollection:
     """
-    existing_allocation = await collection.find_one({
-        "vehicle_id": vehicle_id,
-        "allocation_date": allocation_date.isoformat()
-    })
-    return existing_allocation is not None
+    Provide the MongoDB collection as a FastAPI dependency.
 
-# Helper function to validate if allocation date is before today
-def is_date_in_future(allocation_date: date) -> bool:
-    """
-    Check if an allocation date is in the future.
-
-    Args:
-        allocation_date (date): The allocation date to check.
+    Reads the client stashed on app.state by the lifespan handler, so the
+    routes use the one client bound to the running event loop. Declared
+    async so FastAPI resolves it inline on the event loop instead of
+    dispatching it to the thread pool on every request.
 
     Returns:
-        bool: True if the allocation date is in the future, False otherwise.
+        AsyncCollection: The MongoDB collection.
     """
-    return allocation_date >= date.today()
+    return request.app.state.db.vallocation_collection
 
 # Create an allocation
-@router.post("/allocate/", response_model=VallocationResponse, summary="Create a new vehicle allocation")
-async def create_allocation(allocation: VallocationCreate, collection: AsyncIOMotorCollection = Depends(lambda: collection)):
+@router.post("/allocate/", response_model=VallocationResponse, response_model_exclude_none=True, summary="Create a new vehicle allocation")
+async def create_allocation(allocation: VallocationCreate, collection: AsyncCollection = Depends(get_collection)):
     """
     Create a new vehicle allocation.
 
     Args:
         allocation (VallocationCreate): The allocation data to create.
-        collection (AsyncIOMotorCollection): The MongoDB collection (provided as a dependency).
+        collection (AsyncCollection): The MongoDB collection (provided as a dependency).
 
     Raises:
         HTTPException: If the allocation date is not in the future or the vehicle is already allocated for the requested date.
@@ -65,44 +56,51 @@ async def create_allocation(allocation: VallocationCreate, collection: AsyncIOMo
         VallocationResponse: The created allocation data.
     """
     # Check if the allocation date is in the future
-    if not is_date_in_future(allocation.allocation_date):
+    if allocation.allocation_date < date.today():
         raise HTTPException(
             status_code=400, detail="Allocation date must be in the future."
         )
 
-    # Check if the vehicle is already allocated for the requested date
-    if await is_vehicle_allocated(allocation.vehicle_id, allocation.allocation_date, collection):
-        raise HTTPException(
-            status_code=400, detail="Vehicle is already allocated for the requested date."
-        )
-
     # Get pre-assigned driver for the vehicle (for simplicity, driver_id is set same as vehicle_id here)
     driver_id = allocation.vehicle_id
 
-    # Insert new allocation into MongoDB
+    # Insert new allocation into MongoDB; the unique index on
+    # (vehicle_id, allocation_date) rejects double bookings atomically.
+    # The date is stored as a BSON datetime so index probes compare
+    # numerically and range filters run server-side. The _id is generated
+    # client-side so the response is known before the write is acknowledged.
     new_allocation = {
+        "_id": ObjectId(),
         "employee_id": allocation.employee_id,
         "vehicle_id": allocation.vehicle_id,
         "driver_id": driver_id,
-        "allocation_date": allocation.allocation_date.isoformat(),
+        "allocation_date": datetime.combine(allocation.allocation_date, time.min),
         "status": "pending",
     }
-    result = await collection.insert_one(new_allocation)
 
-    # Return the created allocation
-    created_allocation = await collection.find_one({"_id": result.inserted_id})
-    return VallocationResponse(id=str(created_allocation["_id"]), **created_allocation)
+    # Start the insert, then build the response while the ack is in flight
+    insert_task = asyncio.create_task(collection.insert_one(new_allocation))
+    response = VallocationResponse(
+        id=str(new_allocation["_id"]), **new_allocation)
+    try:
+        await insert_task
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400, detail="Vehicle is already allocated for the requested date."
+        )
+
+    return response
 
 # Update an allocation
-@router.put("/allocate/{allocation_id}", response_model=VallocationResponse, summary="Update an existing vehicle allocation")
-async def update_allocation(allocation_id: str, allocation: VallocationUpdate, collection: AsyncIOMotorCollection = Depends(lambda: collection)):
+@router.put("/allocate/{allocation_id}", response_model=VallocationResponse, response_model_exclude_none=True, summary="Update an existing vehicle allocation")
+async def update_allocation(allocation_id: str, allocation: VallocationUpdate, collection: AsyncCollection = Depends(get_collection)):
     """
     Update an existing vehicle allocation.
 
     Args:
         allocation_id (str): The ID of the allocation to update.
         allocation (VallocationUpdate): The updated allocation data.
-        collection (AsyncIOMotorCollection): The MongoDB collection (provided as a dependency).
+        collection (AsyncCollection): The MongoDB collection (provided as a dependency).
 
     Raises:
         HTTPException: If the allocation ID is invalid, the allocation does not exist, the allocation date is not in the future,
@@ -111,57 +109,55 @@ async def update_allocation(allocation_id: str, allocation: VallocationUpdate, c
     Returns:
         VallocationResponse: The updated allocation data.
     """
-    # Check if the allocation exists
-    try:
-        existing_allocation = await collection.find_one({"_id": ObjectId(allocation_id)})
-    except Exception:
+    # Validate the allocation ID format up front and build the ObjectId once
+    if not ObjectId.is_valid(allocation_id):
         raise HTTPException(
             status_code=400, detail="Invalid allocation ID format.")
-
-    if not existing_allocation:
-        raise HTTPException(status_code=404, detail="Allocation not found.")
-
-    # Ensure the allocation date is in the future for modifications
-    existing_allocation_date = datetime.strptime(
-        existing_allocation["allocation_date"], "%Y-%m-%d").date()
-    if not is_date_in_future(existing_allocation_date):
-        raise HTTPException(
-            status_code=400, detail="Cannot update allocations that have already passed."
-        )
-
-    # If updating allocation date, ensure the vehicle is not already allocated for the new date
-    if allocation.allocation_date:
-        allocation_date_obj = allocation.allocation_date
-        if await is_vehicle_allocated(existing_allocation["vehicle_id"], allocation_date_obj, collection):
-            raise HTTPException(
-                status_code=400, detail="Vehicle is already allocated for the new requested date."
-            )
+    oid = ObjectId(allocation_id)
+    today = datetime.combine(date.today(), time.min)
 
     # Update the allocation fields
-    update_data = {k: v for k, v in allocation.dict(
-        exclude_unset=True).items()}
+    update_data = allocation.model_dump(exclude_unset=True)
 
     # Handle date formatting if allocation_date is being updated
     if 'allocation_date' in update_data:
-        update_data['allocation_date'] = allocation.allocation_date.isoformat()
+        update_data['allocation_date'] = datetime.combine(
+            allocation.allocation_date, time.min)
 
-    # Perform the update in MongoDB
-    await collection.update_one({"_id": ObjectId(allocation_id)}, {"$set": update_data})
+    # Update atomically and return the new document; the date guard in the
+    # filter enforces the "future allocations only" rule server-side, and the
+    # unique index on (vehicle_id, allocation_date) rejects double bookings
+    try:
+        updated_allocation = await collection.find_one_and_update(
+            {"_id": oid, "allocation_date": {"$gte": today}},
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400, detail="Vehicle is already allocated for the new requested date."
+        )
 
-    # Return the updated allocation
-    updated_allocation = await collection.find_one({"_id": ObjectId(allocation_id)})
+    if updated_allocation is None:
+        # Distinguish a missing allocation from one whose date has passed
+        if await collection.find_one({"_id": oid}, _EXIST_PROJ) is None:
+            raise HTTPException(
+                status_code=404, detail="Allocation not found.")
+        raise HTTPException(
+            status_code=400, detail="Cannot update allocations that have already passed."
+        )
 
     return VallocationResponse(id=str(updated_allocation["_id"]), **updated_allocation)
 
 # Delete an allocation
 @router.delete("/allocate/{allocation_id}", summary="Delete an existing vehicle allocation")
-async def delete_allocation(allocation_id: str, collection: AsyncIOMotorCollection = Depends(lambda: collection)):
+async def delete_allocation(allocation_id: str, collection: AsyncCollection = Depends(get_collection)):
     """
     Delete an existing vehicle allocation.
 
     Args:
         allocation_id (str): The ID of the allocation to delete.
-        collection (AsyncIOMotorCollection): The MongoDB collection (provided as a dependency).
+        collection (AsyncCollection): The MongoDB collection (provided as a dependency).
 
     Raises:
         HTTPException: If the allocation does not exist or the allocation date is not in the future.
@@ -169,33 +165,40 @@ async def delete_allocation(allocation_id: str, collection: AsyncIOMotorCollecti
     Returns:
         dict: A success message.
     """
-    # Check if the allocation exists
-    existing_allocation = await collection.find_one({"_id": ObjectId(allocation_id)})
-    if not existing_allocation:
-        raise HTTPException(status_code=404, detail="Allocation not found.")
-
-    # Ensure the allocation date is in the future for deletions
-    existing_allocation_date = datetime.strptime(
-        existing_allocation["allocation_date"], "%Y-%m-%d").date()
-    if not is_date_in_future(existing_allocation_date):
+    # Validate the allocation ID format up front and build the ObjectId once
+    if not ObjectId.is_valid(allocation_id):
+        raise HTTPException(
+            status_code=400, detail="Invalid allocation ID format.")
+    oid = ObjectId(allocation_id)
+
+    # Delete atomically; the date guard in the filter enforces the
+    # "future allocations only" rule server-side in a single round-trip
+    result = await collection.delete_one(
+        {"_id": oid,
+         "allocation_date": {"$gte": datetime.combine(date.today(), time.min)}}
+    )
+
+    if result.deleted_count == 0:
+        # Distinguish a missing allocation from one whose date has passed
+        if await collection.find_one({"_id": oid}, _EXIST_PROJ) is None:
+            raise HTTPException(
+                status_code=404, detail="Allocation not found.")
         raise HTTPException(
             status_code=400, detail="Cannot delete allocations that have already passed."
         )
 
-    # Delete the allocation
-    await collection.delete_one({"_id": ObjectId(allocation_id)})
     return {"detail": "Allocation deleted successfully."}
 
 # Get allocation history with pagination and filters
-@router.get("/history/", response_model=Dict[str, Any], summary="Get allocation history with optional filters and pagination")
+@router.get("/history/", response_model=None, summary="Get allocation history with optional filters and pagination")
 async def get_allocation_history(
     employee_id: Optional[int] = None,
     vehicle_id: Optional[int] = None,
     driver_id: Optional[int] = None,
     allocation_date: Optional[date] = None,
-    skip: int = Query(0, description="Number of records to skip"),
-    limit: int = Query(10, description="Max number of records to return"),
-    collection: AsyncIOMotorCollection = Depends(lambda: collection)
+    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    limit: int = Query(10, ge=1, description="Max number of records to return"),
+    collection: AsyncCollection = Depends(get_collection)
 ):
     """
     Get allocation history with optional filters and pagination.
@@ -207,10 +210,10 @@ async def get_allocation_history(
         allocation_date (Optional[date], optional): Filter allocations by allocation date.
         skip (int, optional): The number of records to skip. Defaults to 0.
         limit (int, optional): The maximum number of records to return. Defaults to 10.
-        collection (AsyncIOMotorCollection): The MongoDB collection (provided as a dependency).
+        collection (AsyncCollection): The MongoDB collection (provided as a dependency).
 
     Returns:
-        Dict[str, Any]: The filtered allocation history with pagination metadata.
+        ORJSONResponse: The filtered allocation history with pagination metadata.
     """
     # Build the filter query
     query = {}
@@ -221,18 +224,53 @@ async def get_allocation_history(
     if driver_id is not None:
         query["driver_id"] = driver_id
     if allocation_date is not None:
-        query["allocation_date"] = allocation_date.isoformat()
-
-    # Query the database for matching allocations with skip and limit
-    allocations = await collection.find(query).skip(skip).limit(limit).to_list(length=limit)
-
-    # Get total count of allocations
-    total_count = await collection.count_documents(query)
-
-    # Return the filtered allocation history and pagination metadata
-    return {
+        query["allocation_date"] = datetime.combine(allocation_date, time.min)
+
+    if query:
+        # Run the page and the total count over one cursor pass with $facet
+        # instead of two separate scans of the same filter
+        pipeline = [
+            {"$match": query},
+            # Most recent first; the compound (field, allocation_date)
+            # indexes (or the plain allocation_date index for date-only
+            # filters) serve this sort without an in-memory sort stage
+            {"$sort": {"allocation_date": -1}},
+            {"$facet": {
+                "results": [{"$skip": skip}, {"$limit": limit}],
+                "total": [{"$count": "n"}],
+            }},
+        ]
+        cursor = await collection.aggregate(pipeline)
+        facets = (await cursor.to_list(length=1))[0]
+        allocations = facets["results"]
+        total_count = facets["total"][0]["n"] if facets["total"] else 0
+    else:
+        # Unfiltered: estimated_document_count reads collection metadata
+        # instead of scanning, so just page with a plain find
+        allocations = await collection.find(query).sort(
+            "allocation_date", -1).skip(skip).limit(limit).to_list(length=limit)
+        total_count = await collection.estimated_document_count()
+
+    # Return the filtered allocation history and pagination metadata as a
+    # direct ORJSONResponse: the values come straight from the database
+    # with types the stored schema already guarantees, so there is nothing
+    # for a response-model validation pass to add — orjson encodes the
+    # datetimes natively
+    return ORJSONResponse({
         "total": total_count,
         "skip": skip,
         "limit": limit,
-        "results": [VallocationResponse(id=str(allocation["_id"]), **allocation) for allocation in allocations]
-    }
+        "results": [
+            {
+                "id": str(allocation["_id"]),
+                "employee_id": allocation["employee_id"],
+                "vehicle_id": allocation["vehicle_id"],
+                "driver_id": allocation["driver_id"],
+                # .date() keeps the wire format at "YYYY-MM-DD", matching
+                # the date-typed response model on the other endpoints
+                "allocation_date": allocation["allocation_date"].date(),
+                "status": allocation["status"],
+            }
+            for allocation in allocations
+        ],
+    })